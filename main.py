@@ -1,12 +1,18 @@
+import atexit
 import logging
 import asyncio
+import operator
 import os
+import re
 import sqlite3
-from datetime import datetime
+import time
+from collections import Counter, OrderedDict
+from datetime import date
+import requests
+from requests.adapters import HTTPAdapter
 from ryanair import Ryanair
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, F, types
 from aiogram.filters import Command
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # --- SETTINGS ---
 API_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
@@ -18,7 +24,15 @@ bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
 # ryanair-py 3.x: only get_cheapest_flights(origin, date_from, date_to, destination_airport=...)
 api = Ryanair(currency="EUR")
-scheduler = AsyncIOScheduler()
+
+# ryanair-py keeps a requests.Session internally; mount a pooled keep-alive
+# adapter on it so repeated calls reuse one TCP+TLS connection instead of
+# paying a fresh handshake per price check.
+_api_session = getattr(api, "session", None)
+if isinstance(_api_session, requests.Session):
+    _adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8)
+    _api_session.mount("https://", _adapter)
+    _api_session.mount("http://", _adapter)
 
 # Ryanair origin airports to search for a flight by number (main bases + common)
 RYANAIR_ORIGINS = [
@@ -28,23 +42,62 @@ RYANAIR_ORIGINS = [
 ]
 
 
+# Resolved once on first use: attrgetter is a single C-level slot lookup,
+# vs two getattr-with-default probes per call on the old path.
+_get_fn = operator.attrgetter('flightNumber')
+
+
 def _flight_number(flight) -> str:
     """Flight number from ryanair-py (3.x: flightNumber, older: flight_number)."""
-    return getattr(flight, 'flightNumber', None) or getattr(flight, 'flight_number', '')
+    global _get_fn
+    try:
+        return _get_fn(flight)
+    except AttributeError:
+        _get_fn = operator.attrgetter('flight_number')
+        return _get_fn(flight)
+
+
+_FR_RE = re.compile(r'^FR[\s-]*(\d+)$', re.I)
 
 
 def _normalize_flight_code(code: str) -> str:
     """Normalize user input to API format (e.g. FR1234 / FR 1234 -> FR1234)."""
-    code = (code or "").strip().upper().replace(" ", "")
-    if not code:
-        return ""
-    return code
+    code = (code or "").strip()
+    m = _FR_RE.match(code)
+    if m:
+        return f"FR{m.group(1)}"
+    return code.upper().replace(" ", "")
 
 # --- DATABASE OPERATIONS ---
+# One shared connection (opened in init_db) instead of connect/close per query.
+# WAL + synchronous=NORMAL cuts the fsync cost of every small write.
+DB: sqlite3.Connection | None = None
+db_lock = asyncio.Lock()
+
+# How often each origin was the successful hit in _find_flight_on_date.
+# Loaded from the origin_hits table at startup; used to probe likely
+# origins first.
+_origin_hits: Counter = Counter()
+
+
+def _configure_conn(conn: sqlite3.Connection):
+    """Apply the per-connection pragmas (needed once per connection if this
+    ever grows into a pool)."""
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=134217728')
+    conn.execute('PRAGMA cache_size=-8000')
+    conn.execute('PRAGMA busy_timeout=5000')
+
+
 def init_db():
-    conn = sqlite3.connect('tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
+    global DB
+    DB = sqlite3.connect('tracker.db', check_same_thread=False, isolation_level=None)
+    # C-level rows with named column access; no magic tuple indices downstream.
+    DB.row_factory = sqlite3.Row
+    _configure_conn(DB)
+    DB.execute('''
         CREATE TABLE IF NOT EXISTS flights (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             chat_id INTEGER,
@@ -55,70 +108,211 @@ def init_db():
             last_price REAL
         )
     ''')
-    conn.commit()
-    conn.close()
-
-def get_tracked_flights(chat_id=None):
-    conn = sqlite3.connect('tracker.db')
-    cursor = conn.cursor()
-    if chat_id:
-        cursor.execute('SELECT * FROM flights WHERE chat_id = ?', (chat_id,))
-    else:
-        cursor.execute('SELECT * FROM flights')
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
-
-def update_price(flight_id, new_price):
-    conn = sqlite3.connect('tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('UPDATE flights SET last_price = ? WHERE id = ?', (new_price, flight_id))
-    conn.commit()
-    conn.close()
-
-
-def delete_tracked_flight(chat_id: int, flight_code_norm: str) -> int:
-    """Delete all records for this chat and flight code. Returns number of deleted rows."""
-    conn = sqlite3.connect('tracker.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        'DELETE FROM flights WHERE chat_id = ? AND flight_number = ?',
-        (chat_id, flight_code_norm),
+    DB.execute('CREATE INDEX IF NOT EXISTS idx_flights_chat ON flights(chat_id)')
+    DB.execute('CREATE INDEX IF NOT EXISTS idx_flights_chat_num ON flights(chat_id, flight_number)')
+    DB.execute('''
+        CREATE TABLE IF NOT EXISTS origin_hits (
+            code TEXT PRIMARY KEY,
+            hits INTEGER
+        )
+    ''')
+    _origin_hits.update(dict(DB.execute('SELECT code, hits FROM origin_hits')))
+    atexit.register(DB.close)
+
+def iter_all_flights():
+    """Stream rows worth checking; flights already departed are filtered in SQL."""
+    return DB.execute(
+        'SELECT id, chat_id, origin, destination, date, flight_number, last_price '
+        "FROM flights WHERE date >= date('now')"
     )
-    deleted = cursor.rowcount or 0
-    conn.commit()
-    conn.close()
-    return deleted
+
+
+async def purge_expired_flights():
+    """Drop rows for flights that departed more than a day ago."""
+    async with db_lock:
+        DB.execute("DELETE FROM flights WHERE date < date('now', '-1 day')")
+
+
+async def list_flights(chat_id):
+    """Rows for /list — just the columns the reply renders."""
+    async with db_lock:
+        return DB.execute(
+            'SELECT flight_number, origin, destination, date, last_price '
+            'FROM flights WHERE chat_id = ?', (chat_id,)
+        ).fetchall()
+
+async def record_origin_hit(origin: str):
+    """Bump the hit count for an origin that resolved a flight search."""
+    _origin_hits[origin] += 1
+    async with db_lock:
+        DB.execute(
+            'INSERT INTO origin_hits (code, hits) VALUES (?, 1) '
+            'ON CONFLICT(code) DO UPDATE SET hits = hits + 1',
+            (origin,),
+        )
+
+
+async def delete_tracked_flight(chat_id: int, flight_code_norm: str) -> int:
+    """Delete all records for this chat and flight code. Returns number of deleted rows."""
+    async with db_lock:
+        # Read first: a typo'd code stays a pure reader under WAL instead of
+        # taking the write lock for a DELETE that touches nothing.
+        row = DB.execute(
+            'SELECT 1 FROM flights WHERE chat_id = ? AND flight_number = ? LIMIT 1',
+            (chat_id, flight_code_norm),
+        ).fetchone()
+        if not row:
+            return 0
+        cursor = DB.execute(
+            'DELETE FROM flights WHERE chat_id = ? AND flight_number = ?',
+            (chat_id, flight_code_norm),
+        )
+        return cursor.rowcount or 0
+
+# --- RYANAIR API CACHE ---
+# Short-TTL cache per (origin, dest, date) so users tracking the same route
+# share one scrape per cycle. Empty results are cached too (shorter TTL) so a
+# dead route doesn't get re-queried on every pass. Size is capped LRU-style:
+# expired entries are never swept, so an unbounded dict would grow forever
+# under a stream of one-off route lookups.
+CACHE_TTL = 600
+NEGATIVE_CACHE_TTL = 30
+CACHE_MAX_ENTRIES = 512
+_flight_cache: OrderedDict[tuple, tuple[float, list, dict]] = OrderedDict()
+
+# Bound concurrent Ryanair calls (price checks and origin probes alike) so a
+# burst doesn't hammer the API.
+_api_sem = asyncio.Semaphore(8)
+
+# Resolved (flight code, date) -> (origin, dest, price). A flight's route is
+# effectively static for a given date, so a long TTL is safe and repeat ADDs
+# of the same flight skip the whole origin fan-out.
+ROUTE_CACHE_TTL = 6 * 3600
+_route_cache: OrderedDict[tuple[str, str], tuple[float, tuple[str, str, float]]] = OrderedDict()
+
+
+def cheapest(origin: str, dest: str | None, date_obj) -> tuple[list, dict]:
+    """get_cheapest_flights for one day, cached by (origin, dest, date).
+
+    Returns (trips, by_fn) where by_fn maps normalized flight code -> trip,
+    so callers match by dict lookup instead of scanning the list.
+    """
+    key = (origin, dest, date_obj.isoformat())
+    cached = _flight_cache.get(key)
+    if cached:
+        ts, trips, by_fn = cached
+        ttl = CACHE_TTL if trips else NEGATIVE_CACHE_TTL
+        if time.monotonic() - ts < ttl:
+            _flight_cache.move_to_end(key)
+            return trips, by_fn
+    trips = api.get_cheapest_flights(origin, date_obj, date_obj, destination_airport=dest) or []
+    by_fn = {_normalize_flight_code(_flight_number(t)): t for t in trips}
+    _flight_cache[key] = (time.monotonic(), trips, by_fn)
+    _flight_cache.move_to_end(key)
+    while len(_flight_cache) > CACHE_MAX_ENTRIES:
+        _flight_cache.popitem(last=False)
+    return trips, by_fn
+
+
+async def cheapest_async(origin: str, dest: str | None, date_obj) -> tuple[list, dict]:
+    """Async front for cheapest(): bounded by _api_sem, blocking call off-thread."""
+    async with _api_sem:
+        return await asyncio.to_thread(cheapest, origin, dest, date_obj)
 
 # --- PRICE CHECK LOGIC ---
+# Stay under Telegram's ~30 msg/s bot-wide limit when alerts burst.
+_send_sem = asyncio.Semaphore(25)
+
+# Recently sent alerts, so an overlapping tick or manual add can't deliver
+# the same (chat, flight, price) twice in quick succession.
+ALERT_DEDUP_TTL = 300
+ALERT_DEDUP_MAX_ENTRIES = 1024
+_recent_alerts: OrderedDict[tuple, float] = OrderedDict()
+
+
+def _already_alerted(chat_id: int, f_number: str, new_price: float) -> bool:
+    """True if this exact alert went out within the dedup window; records it otherwise."""
+    key = (chat_id, f_number, new_price)
+    now = time.monotonic()
+    ts = _recent_alerts.get(key)
+    if ts is not None and now - ts < ALERT_DEDUP_TTL:
+        return True
+    _recent_alerts[key] = now
+    _recent_alerts.move_to_end(key)
+    while len(_recent_alerts) > ALERT_DEDUP_MAX_ENTRIES:
+        _recent_alerts.popitem(last=False)
+    return False
+
+
+async def _send_alert(chat_id: int, msg: str):
+    async with _send_sem:
+        await bot.send_message(chat_id, msg)
+
+
+async def _check_group(origin, dest, date_str, rows):
+    """Fetch one route/date once and diff every tracked row against it.
+
+    Returns a list of (chat_id, msg, db_id, new_price) for changed prices.
+    """
+    try:
+        # date.fromisoformat is C-implemented and much faster than strptime.
+        date_obj = date.fromisoformat(date_str)
+        _, by_fn = await cheapest_async(origin, dest, date_obj)
+    except Exception as e:
+        logging.error(f"Error checking {origin}->{dest} on {date_str}: {e}")
+        return []
+
+    updates = []
+    for db_id, chat_id, f_number, last_price in rows:
+        current_flight = by_fn.get(_normalize_flight_code(f_number))
+        if not current_flight:
+            continue
+        new_price = current_flight.price
+        if new_price != last_price and not _already_alerted(chat_id, f_number, new_price):
+            diff = new_price - last_price
+            direction = "📈 Up" if diff > 0 else "📉 Down"
+            msg = (f"🔔 PRICE CHANGE! {direction}\n"
+                   f"Flight: {f_number} ({origin} -> {dest})\n"
+                   f"Date: {date_str}\n"
+                   f"New Price: {new_price} EUR (was {last_price} EUR)")
+            updates.append((chat_id, msg, db_id, new_price))
+    return updates
+
+
 async def check_prices():
-    flights = get_tracked_flights()
-    if not flights:
+    # One task per unique (origin, dest, date): rows sharing a route share
+    # its API call even on a cold cache.
+    groups: dict[tuple, list] = {}
+    for row in iter_all_flights():
+        groups.setdefault((row['origin'], row['destination'], row['date']), []).append(
+            (row['id'], row['chat_id'], row['flight_number'], row['last_price'])
+        )
+    if not groups:
         return
-
-    for f in flights:
-        db_id, chat_id, origin, dest, date, f_number, last_price = f
+    # All groups in flight at once; one failure must not kill the batch.
+    results = await asyncio.gather(
+        *(_check_group(origin, dest, date_str, rows)
+          for (origin, dest, date_str), rows in groups.items()),
+        return_exceptions=True,
+    )
+    updates = [u for r in results if not isinstance(r, BaseException) for u in r]
+    if not updates:
+        return
+    # Send all alerts concurrently, then persist the new prices in one batch.
+    await asyncio.gather(
+        *(_send_alert(chat_id, msg) for chat_id, msg, _, _ in updates),
+        return_exceptions=True,
+    )
+    async with db_lock:
+        # One explicit transaction: the whole batch costs a single WAL fsync.
+        DB.execute('BEGIN')
         try:
-            # Format date for API
-            date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-            # get_cheapest_flights(origin, date_from, date_to, destination_airport=dest)
-            trips = api.get_cheapest_flights(origin, date_obj, date_obj, destination_airport=dest)
-
-            current_flight = next((t for t in trips if _flight_number(t) == f_number), None) if trips else None
-
-            if current_flight:
-                new_price = current_flight.price
-                if new_price != last_price:
-                    diff = new_price - last_price
-                    direction = "📈 Up" if diff > 0 else "📉 Down"
-                    msg = (f"🔔 PRICE CHANGE! {direction}\n"
-                           f"Flight: {f_number} ({origin} -> {dest})\n"
-                           f"Date: {date}\n"
-                           f"New Price: {new_price} EUR (was {last_price} EUR)")
-                    await bot.send_message(chat_id, msg)
-                    update_price(db_id, new_price)
-        except Exception as e:
-            logging.error(f"Error checking {f_number}: {e}")
+            DB.executemany('UPDATE flights SET last_price = ? WHERE id = ?',
+                           [(new_price, db_id) for _, _, db_id, new_price in updates])
+            DB.execute('COMMIT')
+        except Exception:
+            DB.execute('ROLLBACK')
+            raise
 
 # --- BOT COMMANDS ---
 @dp.message(Command("start"))
@@ -157,155 +351,211 @@ async def cmd_help(message: types.Message):
 
 @dp.message(Command("list"))
 async def cmd_list(message: types.Message):
-    flights = get_tracked_flights(message.chat.id)
+    flights = await list_flights(message.chat.id)
     if not flights:
         await message.answer("You are not tracking any flights.")
         return
 
-    response = "📋 **Your Tracked Flights:**\n"
-    for f in flights:
-        response += f"• {f[5]}: {f[2]}->{f[3]} on {f[4]} (Last price: {f[6]}€)\n"
-    await message.answer(response)
+    body = "\n".join(
+        f"• {f['flight_number']}: {f['origin']}->{f['destination']} on {f['date']} "
+        f"(Last price: {f['last_price']}€)"
+        for f in flights
+    )
+    await message.answer("📋 **Your Tracked Flights:**\n" + body)
 
 @dp.message(Command("clear"))
 async def cmd_clear(message: types.Message):
-    conn = sqlite3.connect('tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM flights WHERE chat_id = ?', (message.chat.id,))
-    conn.commit()
-    conn.close()
+    async with db_lock:
+        DB.execute('DELETE FROM flights WHERE chat_id = ?', (message.chat.id,))
     await message.answer("All your tracking data has been deleted.")
 
+async def _probe_origin(origin: str, flight_code_norm: str, date_obj) -> tuple[str, str, float] | None:
+    """Check one origin for the flight. Returns (origin, dest, price) or None."""
+    try:
+        _, by_fn = await cheapest_async(origin, None, date_obj)
+    except Exception:
+        return None
+    t = by_fn.get(flight_code_norm)
+    return (t.origin, t.destination, t.price) if t else None
+
+
 async def _find_flight_on_date(flight_code_norm: str, date_obj) -> tuple[str, str, float] | None:
-    """Search Ryanair origins for this flight on date. Returns (origin, dest, price) or None."""
-    for origin in RYANAIR_ORIGINS:
-        try:
-            trips = api.get_cheapest_flights(origin, date_obj, date_obj)
-            for t in trips or []:
-                if _normalize_flight_code(_flight_number(t)) == flight_code_norm:
-                    return (t.origin, t.destination, t.price)
-        except Exception:
-            pass
-        await asyncio.sleep(0.4)  # be nice to the API
-    return None
+    """Search Ryanair origins for this flight on date. Returns (origin, dest, price) or None.
+
+    All origins are probed concurrently (the semaphore bounds the fan-out);
+    the first hit wins and the remaining probes are cancelled. Hits are
+    memoized per (flight code, date) so repeat lookups skip the fan-out.
+    """
+    key = (flight_code_norm, date_obj.isoformat())
+    cached = _route_cache.get(key)
+    if cached:
+        ts, found = cached
+        if time.monotonic() - ts < ROUTE_CACHE_TTL:
+            _route_cache.move_to_end(key)
+            return found
+    # Probe historically successful origins first: they grab the semaphore
+    # slots ahead of the long tail, so the average time-to-hit drops.
+    origins = sorted(RYANAIR_ORIGINS, key=lambda o: -_origin_hits[o])
+    tasks = [asyncio.ensure_future(_probe_origin(origin, flight_code_norm, date_obj))
+             for origin in origins]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            found = await fut
+            if found:
+                await record_origin_hit(found[0])
+                _route_cache[key] = (time.monotonic(), found)
+                _route_cache.move_to_end(key)
+                while len(_route_cache) > CACHE_MAX_ENTRIES:
+                    _route_cache.popitem(last=False)
+                return found
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def count_tracked_flights(chat_id: int) -> int:
+    """Tracked-flight count for one chat (index-only scan, no row fetch)."""
+    async with db_lock:
+        return DB.execute(
+            'SELECT COUNT(1) FROM flights WHERE chat_id = ?', (chat_id,)
+        ).fetchone()[0]
 
 
 async def _do_add_flight(chat_id: int, flight_code_norm: str, date_str: str, origin: str, dest: str) -> str | None:
     """Add one flight. Returns None on success, or error message."""
-    existing = get_tracked_flights(chat_id)
-    if len(existing) >= MAX_FLIGHTS:
+    # Cheap early check so a chat at its limit skips the API round-trip; the
+    # guarded INSERT below stays as the race-safe backstop.
+    if await count_tracked_flights(chat_id) >= MAX_FLIGHTS:
         return f"Limit reached! Max {MAX_FLIGHTS} flights."
     try:
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+        date_obj = date.fromisoformat(date_str)
     except ValueError:
         return "Invalid date. Use YYYY-MM-DD."
-    trips = api.get_cheapest_flights(origin, date_obj, date_obj, destination_airport=dest)
+    trips, by_fn = await cheapest_async(origin, dest, date_obj)
     if not trips:
         return f"No flights found for {origin}->{dest} on {date_str}."
-    match = next((t for t in trips if _normalize_flight_code(_flight_number(t)) == flight_code_norm), None)
+    match = by_fn.get(flight_code_norm)
     if not match:
-        available = ", ".join(_flight_number(t) for t in trips)
+        available = ", ".join([_flight_number(t) for t in trips])
         return f"Flight {flight_code_norm} not found on {date_str} for {origin}->{dest}. Available: {available}."
-    conn = sqlite3.connect('tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO flights (chat_id, origin, destination, date, flight_number, last_price)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (chat_id, origin, dest, date_str, _flight_number(match), match.price))
-    conn.commit()
-    conn.close()
+    async with db_lock:
+        # Single race-safe statement: the INSERT only fires while the chat is
+        # under its limit, so there's no separate COUNT round-trip to get stale.
+        cursor = DB.execute('''
+            INSERT INTO flights (chat_id, origin, destination, date, flight_number, last_price)
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE (SELECT COUNT(*) FROM flights WHERE chat_id = ?) < ?
+        ''', (chat_id, origin, dest, date_str, _flight_number(match), match.price,
+              chat_id, MAX_FLIGHTS))
+        if cursor.rowcount == 0:
+            return f"Limit reached! Max {MAX_FLIGHTS} flights."
     return None  # success
 
 
-@dp.message()
-async def handle_message(message: types.Message):
+# The regexp filters route ADD/DELETE straight to their handlers, so other
+# messages never enter them and nothing uppercases the whole text per message.
+@dp.message(F.text.regexp(r'(?i)^add(\s|$)'))
+async def handle_add(message: types.Message):
     chat_id = message.chat.id
     text = (message.text or "").strip()
-    upper_text = text.upper()
 
     try:
-        # ADD command
-        if upper_text.startswith("ADD"):
-            parts = text.split()
-            if len(parts) == 5:
-                # ADD flight date origin dest
-                _, flight_code, date_str, origin, dest = parts
-                origin, dest = origin.upper(), dest.upper()
-                flight_code_norm = _normalize_flight_code(flight_code)
-                if not flight_code_norm:
-                    await message.answer("Enter a valid flight code (e.g. FR1234).")
-                    return
+        parts = text.split()
+        if len(parts) == 5:
+            # ADD flight date origin dest
+            _, flight_code, date_str, origin, dest = parts
+            origin, dest = origin.upper(), dest.upper()
+            flight_code_norm = _normalize_flight_code(flight_code)
+            if not flight_code_norm:
+                await message.answer("Enter a valid flight code (e.g. FR1234).")
+                return
+            err = await _do_add_flight(chat_id, flight_code_norm, date_str, origin, dest)
+            if err:
+                await message.answer(f"⚠️ {err}")
+            else:
+                await message.answer(
+                    f"✅ Now tracking {flight_code_norm} ({origin}→{dest}) on {date_str}. Check /list."
+                )
+            return
+        if len(parts) == 3:
+            # ADD flight date
+            _, flight_code, date_str = parts
+            flight_code_norm = _normalize_flight_code(flight_code)
+            if not flight_code_norm:
+                await message.answer("Enter a valid flight code (e.g. FR1234).")
+                return
+            try:
+                date_obj = date.fromisoformat(date_str)
+            except ValueError:
+                await message.answer("Invalid date. Use YYYY-MM-DD.")
+                return
+            await message.answer("Searching for your flight…")
+            found = await _find_flight_on_date(flight_code_norm, date_obj)
+            if found:
+                origin, dest, price = found
                 err = await _do_add_flight(chat_id, flight_code_norm, date_str, origin, dest)
                 if err:
                     await message.answer(f"⚠️ {err}")
                 else:
                     await message.answer(
-                        f"✅ Now tracking {flight_code_norm} ({origin}→{dest}) on {date_str}. Check /list."
+                        f"✅ Now tracking {flight_code_norm} ({origin}→{dest}) on {date_str}. Price: {price}€"
                     )
-                return
-            if len(parts) == 3:
-                # ADD flight date
-                _, flight_code, date_str = parts
-                flight_code_norm = _normalize_flight_code(flight_code)
-                if not flight_code_norm:
-                    await message.answer("Enter a valid flight code (e.g. FR1234).")
-                    return
-                try:
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                except ValueError:
-                    await message.answer("Invalid date. Use YYYY-MM-DD.")
-                    return
-                await message.answer("Searching for your flight…")
-                found = await _find_flight_on_date(flight_code_norm, date_obj)
-                if found:
-                    origin, dest, price = found
-                    err = await _do_add_flight(chat_id, flight_code_norm, date_str, origin, dest)
-                    if err:
-                        await message.answer(f"⚠️ {err}")
-                    else:
-                        await message.answer(
-                            f"✅ Now tracking {flight_code_norm} ({origin}→{dest}) on {date_str}. Price: {price}€"
-                        )
-                else:
-                    await message.answer(
-                        f"Flight {flight_code_norm} not found on {date_str}. "
-                        "Try: `ADD FR1234 2026-05-20 VNO BVA` with origin and destination."
-                    )
-                return
-            await message.answer(
-                "Usage: `ADD FR1234 2026-05-20` or `ADD FR1234 2026-05-20 VNO BVA`"
-            )
+            else:
+                await message.answer(
+                    f"Flight {flight_code_norm} not found on {date_str}. "
+                    "Try: `ADD FR1234 2026-05-20 VNO BVA` with origin and destination."
+                )
             return
+        await message.answer(
+            "Usage: `ADD FR1234 2026-05-20` or `ADD FR1234 2026-05-20 VNO BVA`"
+        )
+    except Exception as e:
+        await message.answer(f"⚠️ Error: {str(e)}")
 
-        # delete command
-        if upper_text.startswith("DELETE"):
-            parts = text.split()
-            if len(parts) != 2:
-                await message.answer("Usage: `delete FR1234`")
-                return
-            _, flight_code = parts
-            flight_code_norm = _normalize_flight_code(flight_code)
-            if not flight_code_norm:
-                await message.answer("Enter a valid flight code (e.g. FR1234).")
-                return
-            deleted = delete_tracked_flight(chat_id, flight_code_norm)
-            if deleted:
-                await message.answer(f"Deleted {deleted} tracking record(s) for {flight_code_norm}.")
-            else:
-                await message.answer(f"You are not tracking flight {flight_code_norm}.")
+
+@dp.message(F.text.regexp(r'(?i)^delete(\s|$)'))
+async def handle_delete(message: types.Message):
+    chat_id = message.chat.id
+    text = (message.text or "").strip()
+
+    try:
+        parts = text.split()
+        if len(parts) != 2:
+            await message.answer("Usage: `delete FR1234`")
+            return
+        _, flight_code = parts
+        flight_code_norm = _normalize_flight_code(flight_code)
+        if not flight_code_norm:
+            await message.answer("Enter a valid flight code (e.g. FR1234).")
             return
+        deleted = await delete_tracked_flight(chat_id, flight_code_norm)
+        if deleted:
+            await message.answer(f"Deleted {deleted} tracking record(s) for {flight_code_norm}.")
+        else:
+            await message.answer(f"You are not tracking flight {flight_code_norm}.")
     except Exception as e:
         await message.answer(f"⚠️ Error: {str(e)}")
 
 # --- RUN ---
+async def _periodic(interval_s: float, func):
+    """Run func every interval_s seconds; one failure must not kill the loop."""
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            await func()
+        except Exception as e:
+            logging.error(f"Periodic {func.__name__} failed: {e}")
+
+
 async def main():
     if not API_TOKEN:
         logging.error("Set TELEGRAM_BOT_TOKEN (env var or .env file).")
         raise SystemExit(1)
     init_db()
     logging.basicConfig(level=logging.INFO)
-    scheduler.add_job(check_prices, "interval", hours=CHECK_INTERVAL_HOURS)
-    scheduler.start()
+    asyncio.create_task(_periodic(CHECK_INTERVAL_HOURS * 3600, check_prices))
+    asyncio.create_task(_periodic(24 * 3600, purge_expired_flights))
     print("Bot is running...")
     await dp.start_polling(bot)
 